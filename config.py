@@ -9,13 +9,16 @@ class ETLConfig:
     driver: str = 'SQL Server Native Client 11.0'
     username: str = 'sa'
     password: str = 'password'
+    packet_size: int = 32767  # TDS packet size in bytes, server default is 4096
     
     # Data paths
     data_path: str = r'c:\Users\Kuba\PycharmProjects\hurtownie\data'
+    parquet_cache: bool = True  # keep parsed sources under data_path/cache
     
     # Processing parameters
     batch_size: int = 10000
     fuzzy_threshold: int = 60
+    bulk_logged_load: bool = False  # switch FULL recovery to BULK_LOGGED for the fact load
     
     # Date ranges
     start_date: str = '2016-01-01'
@@ -4,9 +4,61 @@ from typing import Optional
 from utils import *
 from config import ETLConfig
 
+try:
+    import pyarrow  # noqa: F401
+    HAS_PYARROW = True
+except ImportError:
+    HAS_PYARROW = False
+
+CSV_ENGINE = 'pyarrow' if HAS_PYARROW else 'c'
+
+SOURCE_DATE_FORMAT = '%Y-%m-%d %H:%M:%S'
+
 class T1_DataExtractor:
     """Task 1: Extract and validate source data files"""
     
+    # Only the columns consumed by validation and the T3/T4 builds are loaded
+    SOURCE_COLUMNS = {
+        'orders': ['order_id', 'customer_id', 'order_status', 'order_purchase_timestamp',
+                   'order_delivered_customer_date', 'order_estimated_delivery_date'],
+        'order_items': ['order_id', 'order_item_id', 'product_id', 'seller_id', 
+                        'price', 'freight_value'],
+        'customers': ['customer_id', 'customer_unique_id', 'customer_zip_code_prefix',
+                      'customer_city', 'customer_state'],
+        'sellers': ['seller_id', 'seller_zip_code_prefix', 'seller_city', 'seller_state'],
+        'payments': ['order_id', 'payment_type', 'payment_installments', 'payment_value'],
+        'reviews': ['order_id', 'review_score', 'review_comment_message'],
+        'cities': ['CITY', 'STATE', 'CAPITAL', 'IBGE_POP', 'GDP_CAPITA', 'IDHM', 'IDHM_Renda',
+                   'IDHM_Educacao', 'IDHM_Longevidade', 'CATEGORIA_TUR']
+    }
+    
+    # Low-cardinality text columns kept as categoricals
+    CATEGORY_COLUMNS = {
+        'orders': ['order_status'],
+        'customers': ['customer_state'],
+        'sellers': ['seller_state'],
+        'payments': ['payment_type']
+    }
+    
+    # Timestamp columns parsed once at read time with the fixed source format
+    DATE_COLUMNS = {
+        'orders': ['order_purchase_timestamp', 'order_delivered_customer_date',
+                   'order_estimated_delivery_date']
+    }
+    
+    # Narrow integer widths for bounded numeric columns; money columns stay float64
+    # so prices and freight round-trip exactly into DECIMAL
+    NUMERIC_DTYPES = {
+        'order_items': {'order_item_id': 'int16'},
+        'customers': {'customer_zip_code_prefix': 'int32'},
+        'sellers': {'seller_zip_code_prefix': 'int32'},
+        'payments': {'payment_installments': 'int8'},
+        'reviews': {'review_score': 'int8'}
+    }
+    
+    # Review comments contain quoted line breaks, which the pyarrow reader rejects
+    C_ENGINE_TABLES = {'reviews'}
+    
     def __init__(self, config: ETLConfig, logger: ETLLogger, quality_manager: DataQualityManager):
         self.config = config
         self.logger = logger
@@ -38,6 +90,9 @@ class T1_DataExtractor:
             if not self._validate_extracted_data():
                 return False
             
+            # Order-level aggregates shared by the fact build
+            self._aggregate_order_data()
+            
             self.logger.info("T1: Data extraction completed successfully")
             return True
             
@@ -54,7 +109,7 @@ class T1_DataExtractor:
                 self.logger.error(f"T1: File not found: {full_path}")
                 return False
             
-            df = pd.read_csv(full_path, encoding='utf-8')
+            df = self._read_source(table_name, full_path)
 
             if table_name == 'customers':
                 df = df.drop_duplicates(subset=['customer_id'], keep='last')
@@ -71,6 +126,34 @@ class T1_DataExtractor:
             self.logger.error(f"T1: Failed to load {table_name}: {e}")
             return False
     
+    def _read_source(self, table_name: str, full_path: str) -> pd.DataFrame:
+        """Read a source CSV, reusing its Parquet copy while it is newer than the CSV"""
+        cache_file = os.path.join(self.config.data_path, 'cache', f"{table_name}.parquet")
+        use_cache = self.config.parquet_cache and HAS_PYARROW
+        
+        if use_cache and os.path.exists(cache_file) \
+                and os.path.getmtime(cache_file) >= os.path.getmtime(full_path):
+            self.logger.info(f"T1: Reading {table_name} from cache {cache_file}")
+            return pd.read_parquet(cache_file)
+        
+        engine = 'c' if table_name in self.C_ENGINE_TABLES else CSV_ENGINE
+        df = pd.read_csv(full_path, encoding='utf-8', engine=engine,
+                         usecols=self.SOURCE_COLUMNS.get(table_name),
+                         dtype=self.NUMERIC_DTYPES.get(table_name))
+        for column in self.CATEGORY_COLUMNS.get(table_name, []):
+            df[column] = df[column].astype('category')
+        for column in self.DATE_COLUMNS.get(table_name, []):
+            df[column] = pd.to_datetime(df[column], format=SOURCE_DATE_FORMAT, errors='coerce')
+        
+        if use_cache:
+            try:
+                os.makedirs(os.path.dirname(cache_file), exist_ok=True)
+                df.to_parquet(cache_file, index=False)
+            except Exception as e:
+                self.logger.warning(f"T1: Could not cache {table_name}: {e}")
+        
+        return df
+    
     def _validate_extracted_data(self) -> bool:
         """Validate all extracted data"""
         validation_rules = {
@@ -94,6 +177,22 @@ class T1_DataExtractor:
         
         return True
     
+    def _aggregate_order_data(self):
+        """Aggregate order items and payments per order once, keyed by order_id"""
+        items_agg = self.data_frames['order_items'].groupby('order_id', sort=False).agg(
+            price=('price', 'sum'),
+            freight_value=('freight_value', 'sum'),
+            order_item_id=('order_item_id', 'count'),
+            seller_id=('seller_id', 'first')  # Take first seller for the order
+        )
+        self.data_frames['items_agg'] = items_agg.astype({'order_item_id': 'int16'})
+        self.data_frames['payments_agg'] = self.data_frames['payments'].groupby('order_id', sort=False).agg(
+            payment_type=('payment_type', 'first'),
+            payment_installments=('payment_installments', 'first'),
+            payment_value=('payment_value', 'sum')
+        )
+        self.logger.info(f"T1: Aggregated {len(self.data_frames['items_agg'])} orders with items")
+    
     def get_dataframe(self, table_name: str) -> Optional[pd.DataFrame]:
         """Get extracted DataFrame"""
         return self.data_frames.get(table_name)
\ No newline at end of file
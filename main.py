@@ -38,6 +38,8 @@ class T5_ETLOrchestrator:
                 ("T2_Create_Schema", self._execute_schema_creation),
                 ("T3_Build_Dimensions", self._execute_dimension_building),
                 ("T4_Build_Facts", self._execute_fact_building),
+                ("T4_Create_Constraints", self._execute_constraint_creation),
+                ("T4_Build_Rollups", self._execute_rollup_building),
                 ("T5_Validate_Results", self._execute_final_validation)
             ]
             
@@ -70,6 +72,8 @@ class T5_ETLOrchestrator:
         except Exception as e:
             self.logger.error(f"CRITICAL ETL FAILURE: {e}")
             return False
+        finally:
+            self.db_manager.close()
     
     def _execute_data_extraction(self) -> bool:
         """Execute T1: Data Extraction"""
@@ -107,9 +111,27 @@ class T5_ETLOrchestrator:
     def _execute_fact_building(self) -> bool:
         """Execute T4: Fact Building"""
         self.fact_builder = T4_FactBuilder(
-            self.config, self.logger, self.db_manager, self.data_extractor
+            self.config, self.logger, self.db_manager, self.data_extractor,
+            self.dimension_builder.dim_keys
         )
-        return self.fact_builder.execute()
+        if not self.schema_manager.begin_fact_load():
+            return False
+        
+        loaded = False
+        try:
+            loaded = self.fact_builder.execute()
+        finally:
+            # Revalidate constraints and restore the recovery model even if the load raised
+            restored = self.schema_manager.end_fact_load()
+        return loaded and restored
+    
+    def _execute_constraint_creation(self) -> bool:
+        """Execute T4 follow-up: foreign keys and indexes after the bulk load"""
+        return self.schema_manager.create_indexes_and_fks()
+    
+    def _execute_rollup_building(self) -> bool:
+        """Execute T4 follow-up: materialized rollup tables"""
+        return self.fact_builder.build_rollups()
     
     def _execute_final_validation(self) -> bool:
         """Execute T5: Final Validation and Quality Checks"""
@@ -144,8 +166,6 @@ class T5_ETLOrchestrator:
         except Exception as e:
             self.logger.error(f"T5: Final validation failed: {e}")
             return False
-        finally:
-            conn.close()
     
     def _get_table_counts(self, cursor) -> Dict[str, int]:
         """Get record counts for all tables"""
@@ -5,10 +5,28 @@ from config import ETLConfig
 class T2_SchemaManager:
     """Task 2: Create and manage database schema"""
     
+    # Fact foreign keys are created after the bulk load: (key column, dimension table)
+    FACT_FOREIGN_KEYS = [
+        ('Time_Key', 'DIM_Time'),
+        ('Customer_Key', 'DIM_Customer'),
+        ('Seller_Key', 'DIM_Seller'),
+        ('Payment_Key', 'DIM_Payment'),
+        ('Review_Key', 'DIM_Review')
+    ]
+    
+    # Natural-key indexes covering surrogate key lookups: (table, natural key columns, surrogate key)
+    DIMENSION_NATURAL_KEYS = [
+        ('DIM_Customer', 'Customer_ID', 'Customer_Key'),
+        ('DIM_Seller', 'Seller_ID', 'Seller_Key'),
+        ('DIM_Payment', 'Payment_Type, Installments_Range', 'Payment_Key'),
+        ('DIM_Review', 'Review_Score', 'Review_Key')
+    ]
+    
     def __init__(self, config: ETLConfig, logger: ETLLogger, db_manager: DatabaseManager):
         self.config = config
         self.logger = logger
         self.db_manager = db_manager
+        self._restore_recovery_model = None
     
     def execute(self) -> bool:
         """Execute schema creation process"""
@@ -21,12 +39,8 @@ class T2_SchemaManager:
         try:
             cursor = conn.cursor()
             
-            # Drop existing tables in correct order
-            if not self._drop_existing_tables(cursor):
-                return False
-            
-            # Create new tables
-            if not self._create_tables(cursor):
+            # Drop existing tables and create new ones in a single batch
+            if not self._recreate_tables(cursor):
                 return False
             
             conn.commit()
@@ -37,13 +51,152 @@ class T2_SchemaManager:
             self.logger.error(f"T2: Schema creation failed: {e}")
             conn.rollback()
             return False
+    
+    def create_indexes_and_fks(self) -> bool:
+        """Create fact foreign keys, their indexes and dimension natural-key indexes after the load"""
+        conn = self.db_manager.get_connection()
+        if not conn:
+            return False
+        
+        try:
+            cursor = conn.cursor()
+            
+            for key_column, dim_table in self.FACT_FOREIGN_KEYS:
+                cursor.execute(f"""
+                    ALTER TABLE FACT_Orders ADD CONSTRAINT FK_FACT_Orders_{key_column}
+                    FOREIGN KEY ({key_column}) REFERENCES {dim_table}({key_column});
+                """)
+                cursor.execute(f"CREATE NONCLUSTERED INDEX IX_FACT_Orders_{key_column} ON FACT_Orders ({key_column});")
+                self.logger.info(f"T2: Created foreign key and index on FACT_Orders.{key_column}")
+            
+            for dim_table, natural_key, surrogate_key in self.DIMENSION_NATURAL_KEYS:
+                cursor.execute(f"""
+                    CREATE NONCLUSTERED INDEX IX_{dim_table}_NK ON {dim_table} ({natural_key})
+                    INCLUDE ({surrogate_key});
+                """)
+            self.logger.info("T2: Created dimension natural key indexes")
+            
+            conn.commit()
+            return True
+            
+        except Exception as e:
+            self.logger.error(f"T2: Failed to create foreign keys: {e}")
+            conn.rollback()
+            return False
+    
+    def disable_constraints(self) -> bool:
+        """Stop checking fact constraints while reloading into existing tables"""
+        return self._execute_maintenance(
+            ["ALTER TABLE FACT_Orders NOCHECK CONSTRAINT ALL;"],
+            "Disabled FACT_Orders constraints"
+        )
+    
+    def enable_constraints(self, rebuild_indexes: bool = True) -> bool:
+        """Revalidate fact constraints and optionally rebuild its indexes after a reload"""
+        statements = ["ALTER TABLE FACT_Orders WITH CHECK CHECK CONSTRAINT ALL;"]
+        if rebuild_indexes:
+            statements.append("ALTER INDEX ALL ON FACT_Orders REBUILD;")
+        return self._execute_maintenance(
+            statements,
+            "Enabled FACT_Orders constraints" + (" and rebuilt indexes" if rebuild_indexes else "")
+        )
+    
+    def begin_fact_load(self) -> bool:
+        """Prepare for the fact bulk load: constraints off, optional bulk-logged recovery"""
+        if self.config.bulk_logged_load and not self._switch_to_bulk_logged():
+            return False
+        if self.disable_constraints():
+            return True
+        
+        # The load will not run, so do not leave the database in BULK_LOGGED
+        self._restore_recovery()
+        return False
+    
+    def end_fact_load(self) -> bool:
+        """Revalidate constraints and restore the recovery model after the fact load"""
+        constraints_ok = self.enable_constraints(rebuild_indexes=False)
+        return self._restore_recovery() and constraints_ok
+    
+    def _restore_recovery(self) -> bool:
+        """Switch back to the recovery model replaced by begin_fact_load, if any"""
+        if not self._restore_recovery_model:
+            return True
+        
+        model, self._restore_recovery_model = self._restore_recovery_model, None
+        return self._set_recovery_model(model)
+    
+    def _switch_to_bulk_logged(self) -> bool:
+        """Use BULK_LOGGED recovery for the load window if the database runs FULL"""
+        conn = self.db_manager.get_connection()
+        if not conn:
+            return False
+        
+        try:
+            cursor = conn.cursor()
+            cursor.execute("SELECT recovery_model_desc FROM sys.databases WHERE name = DB_NAME();")
+            current_model = cursor.fetchone()[0]
+            conn.commit()
+        except Exception as e:
+            self.logger.error(f"T2: Could not read recovery model: {e}")
+            conn.rollback()
+            return False
+        
+        # SIMPLE recovery already logs bulk inserts minimally
+        if current_model != 'FULL':
+            self.logger.info(f"T2: Recovery model is {current_model}, leaving it unchanged")
+            return True
+        
+        if not self._set_recovery_model('BULK_LOGGED'):
+            return False
+        self._restore_recovery_model = current_model
+        return True
+    
+    def _set_recovery_model(self, model: str) -> bool:
+        """ALTER DATABASE cannot run inside a transaction, so switch to autocommit"""
+        conn = self.db_manager.get_connection()
+        if not conn:
+            return False
+        
+        try:
+            conn.autocommit = True
+            conn.cursor().execute(f"ALTER DATABASE [{self.config.database}] SET RECOVERY {model};")
+            self.logger.info(f"T2: Recovery model set to {model}")
+            return True
+            
+        except Exception as e:
+            self.logger.error(f"T2: Failed to set recovery model {model}: {e}")
+            return False
+            
         finally:
-            conn.close()
+            conn.autocommit = False
     
-    def _drop_existing_tables(self, cursor) -> bool:
-        """Drop existing tables in correct order"""
+    def _execute_maintenance(self, statements: List[str], message: str) -> bool:
+        """Run schema maintenance statements in one transaction"""
+        conn = self.db_manager.get_connection()
+        if not conn:
+            return False
+        
+        try:
+            cursor = conn.cursor()
+            for sql in statements:
+                cursor.execute(sql)
+            
+            conn.commit()
+            self.logger.info(f"T2: {message}")
+            return True
+            
+        except Exception as e:
+            self.logger.error(f"T2: Schema maintenance failed: {e}")
+            conn.rollback()
+            return False
+    
+    def _recreate_tables(self, cursor) -> bool:
+        """Drop existing tables in correct order and create all tables in one round trip"""
         try:
             drop_order = [
+                "MV_Monthly_Revenue",
+                "MV_Seller_State_KPI",
+                "MV_Payment_Category_Quarter",
                 "FACT_Orders",
                 "DIM_Time", 
                 "DIM_Customer",
@@ -51,28 +204,17 @@ class T2_SchemaManager:
                 "DIM_Payment",
                 "DIM_Review"
             ]
-            
-            for table in drop_order:
-                cursor.execute(f"DROP TABLE IF EXISTS {table};")
-                self.logger.info(f"T2: Dropped table {table}")
-            
-            return True
-        except Exception as e:
-            self.logger.error(f"T2: Failed to drop tables: {e}")
-            return False
-    
-    def _create_tables(self, cursor) -> bool:
-        """Create all data warehouse tables"""
-        try:
             table_definitions = self._get_table_definitions()
             
-            for table_name, sql in table_definitions:
-                cursor.execute(sql)
-                self.logger.info(f"T2: Created table {table_name}")
+            statements = [f"DROP TABLE IF EXISTS {table};" for table in drop_order]
+            statements += [sql for _, sql in table_definitions]
+            cursor.execute("\n".join(statements))
             
+            self.logger.info(f"T2: Dropped tables {', '.join(drop_order)}")
+            self.logger.info(f"T2: Created tables {', '.join(name for name, _ in table_definitions)}")
             return True
         except Exception as e:
-            self.logger.error(f"T2: Failed to create tables: {e}")
+            self.logger.error(f"T2: Failed to recreate tables: {e}")
             return False
     
     def _get_table_definitions(self) -> List[Tuple[str, str]]:
@@ -80,7 +222,7 @@ class T2_SchemaManager:
         return [
             ("DIM_Time", """
                 CREATE TABLE DIM_Time (
-                    Time_Key INT IDENTITY(1,1) PRIMARY KEY,
+                    Time_Key INT PRIMARY KEY,
                     Date_Value DATE NOT NULL,
                     Day_Name NVARCHAR(20),
                     Day_Number INT,
@@ -96,7 +238,7 @@ class T2_SchemaManager:
             """),
             ("DIM_Customer", """
                 CREATE TABLE DIM_Customer (
-                    Customer_Key INT IDENTITY(1,1) PRIMARY KEY,
+                    Customer_Key INT PRIMARY KEY,
                     Customer_ID NVARCHAR(50) NOT NULL,
                     Customer_Unique_ID NVARCHAR(50),
                     Customer_Zip_Code NVARCHAR(10),
@@ -115,7 +257,7 @@ class T2_SchemaManager:
             """),
             ("DIM_Seller", """
                 CREATE TABLE DIM_Seller (
-                    Seller_Key INT IDENTITY(1,1) PRIMARY KEY,
+                    Seller_Key INT PRIMARY KEY,
                     Seller_ID NVARCHAR(50) NOT NULL,
                     Seller_Zip_Code NVARCHAR(10),
                     Seller_City NVARCHAR(100),
@@ -133,7 +275,7 @@ class T2_SchemaManager:
             """),
             ("DIM_Payment", """
                 CREATE TABLE DIM_Payment (
-                    Payment_Key INT IDENTITY(1,1) PRIMARY KEY,
+                    Payment_Key INT PRIMARY KEY,
                     Payment_Type NVARCHAR(50),
                     Payment_Category NVARCHAR(50),
                     Installments_Range NVARCHAR(20),
@@ -143,7 +285,7 @@ class T2_SchemaManager:
             """),
             ("DIM_Review", """
                 CREATE TABLE DIM_Review (
-                    Review_Key INT IDENTITY(1,1) PRIMARY KEY,
+                    Review_Key INT PRIMARY KEY,
                     Review_Score INT,
                     Review_Category NVARCHAR(30),
                     Satisfaction_Level NVARCHAR(20),
@@ -167,12 +309,7 @@ class T2_SchemaManager:
                     Review_Score INT,
                     Purchase_Date DATE,
                     Delivery_Date DATE,
-                    Estimated_Delivery_Date DATE,
-                    FOREIGN KEY (Time_Key) REFERENCES DIM_Time(Time_Key),
-                    FOREIGN KEY (Customer_Key) REFERENCES DIM_Customer(Customer_Key),
-                    FOREIGN KEY (Seller_Key) REFERENCES DIM_Seller(Seller_Key),
-                    FOREIGN KEY (Payment_Key) REFERENCES DIM_Payment(Payment_Key),
-                    FOREIGN KEY (Review_Key) REFERENCES DIM_Review(Review_Key)
+                    Estimated_Delivery_Date DATE
                 );
             """)
         ]
\ No newline at end of file
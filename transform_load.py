@@ -1,11 +1,85 @@
+from concurrent.futures import ThreadPoolExecutor
 from utils import *
 from extract import T1_DataExtractor
-from datetime import datetime, timedelta
+
+
+# Payment type categories, anything else is 'Other'
+PAYMENT_CATEGORIES = {
+    'credit_card': 'Credit Card',
+    'boleto': 'Boleto',
+    'voucher': 'Voucher',
+    'debit_card': 'Debit Card'
+}
+
+# Installment ranges shared by the payment dimension and fact key lookups, as
+# right-closed bin edges; non-positive counts fall into '2-3 installments'
+INSTALLMENT_EDGES = np.array([0, 1, 3, 6, 12])
+INSTALLMENT_LABELS = np.array(['2-3 installments', '1 installment', '2-3 installments',
+                               '4-6 installments', '7-12 installments', '13+ installments'], dtype=object)
+
+# Review score categories as (Review_Category, Satisfaction_Level)
+REVIEW_SCORE_CATEGORIES = {
+    1: ('Negative', 'Unsatisfied'),
+    2: ('Negative', 'Unsatisfied'),
+    3: ('Neutral', 'Neutral'),
+    4: ('Positive', 'Satisfied'),
+    5: ('Positive', 'Satisfied')
+}
+
+# Comment length categories, left-closed; blank comments have length 0
+COMMENT_LENGTH_BINS = [0, 1, 30, 50, 100, 200, np.inf]
+COMMENT_LENGTH_LABELS = ['No Comment', 'Short (<30)', 'Medium (30-49)', 'Long (50-99)',
+                         'Very Long (100-199)', 'Extremely Long (200+)']
+
+
+def _installments_range(installments: pd.Series) -> np.ndarray:
+    """Classify installment counts into range labels with one searchsorted pass"""
+    return INSTALLMENT_LABELS[np.searchsorted(INSTALLMENT_EDGES, installments.to_numpy(dtype=float))]
+
+
+def _time_key(dates: pd.DatetimeIndex) -> np.ndarray:
+    """Smart YYYYMMDD integer keys, so fact rows derive Time_Key without a lookup"""
+    return (dates.year * 10000 + dates.month * 100 + dates.day).to_numpy()
+
+
+def _key_lookup(keys_df: pd.DataFrame, natural_key: str, surrogate_key: str) -> pd.Series:
+    """Natural key -> surrogate key Series; repeated natural keys keep the last key"""
+    return keys_df.drop_duplicates(subset=natural_key, keep='last').set_index(natural_key)[surrogate_key]
+
+
+def _payment_key_lookup(payment_df: pd.DataFrame) -> pd.DataFrame:
+    """Payment keys by (type, range) as categoricals; the last key per pair wins"""
+    pair = ['Payment_Type', 'Installments_Range']
+    return payment_df[['Payment_Key'] + pair].drop_duplicates(subset=pair, keep='last').astype(
+        {'Payment_Type': 'category', 'Installments_Range': 'category'}
+    )
 
 
 class T3_DimensionBuilder:
     """Task 3: Build all dimension tables with data cleansing and enrichment"""
     
+    # Brazil regions mapping
+    REGION_MAP = {
+        'AC': 'North', 'AL': 'Northeast', 'AP': 'North', 'AM': 'North', 'BA': 'Northeast',
+        'CE': 'Northeast', 'DF': 'Central-West', 'ES': 'Southeast', 'GO': 'Central-West',
+        'MA': 'Northeast', 'MT': 'Central-West', 'MS': 'Central-West', 'MG': 'Southeast',
+        'PA': 'North', 'PB': 'Northeast', 'PR': 'South', 'PE': 'Northeast', 'PI': 'Northeast',
+        'RJ': 'Southeast', 'RN': 'Northeast', 'RS': 'South', 'RO': 'North', 'RR': 'North',
+        'SC': 'South', 'SP': 'Southeast', 'SE': 'Northeast', 'TO': 'North'
+    }
+    
+    # City attributes shared by geographic dimensions: (column, cities column, default)
+    CITY_COLUMNS = [
+        ('City_Population', 'population', 0),
+        ('City_GDP_Per_Capita', 'gdp_capita', 0),
+        ('City_HDI', 'hdi', 0),
+        ('City_HDI_Income', 'hdi_income', 0),
+        ('City_HDI_Education', 'hdi_education', 0),
+        ('City_HDI_Longevity', 'hdi_longevity', 0),
+        ('City_Is_Capital', 'is_capital', 0),
+        ('City_Category', 'category', 'None')
+    ]
+    
     def __init__(self, config: ETLConfig, logger: ETLLogger, 
                  db_manager: DatabaseManager, data_extractor: T1_DataExtractor,
                  quality_manager: DataQualityManager):
@@ -15,11 +89,24 @@ class T3_DimensionBuilder:
         self.data_extractor = data_extractor
         self.quality_manager = quality_manager
         self.metrics = {}
+        self.dim_keys = {}
+        self._cities = None
+        self._cities_by_state = {}
+        self._exact_index_by_state = {}
     
     def execute(self) -> bool:
         """Execute all dimension building tasks"""
         self.logger.info("=== T3: Starting Dimension Building ===")
         
+        # Cities index is shared by the customer and seller dimensions
+        self._cities = self._build_cities_index()
+        self._cities_by_state = self.quality_manager.group_cities_by_state(
+            self._cities['normalized_name'], self._cities['state']
+        )
+        self._exact_index_by_state = self.quality_manager.build_exact_city_index(self._cities_by_state)
+        
+        # Dimensions do not depend on each other, so all of them are built
+        # concurrently, each on its own connection
         dimension_tasks = [
             ("Time", self._build_time_dimension),
             ("Customer", self._build_customer_dimension),
@@ -28,60 +115,55 @@ class T3_DimensionBuilder:
             ("Review", self._build_review_dimension)
         ]
         
-        for dim_name, task_func in dimension_tasks:
+        if not self._run_dimension_tasks(dimension_tasks):
+            return False
+        
+        self.logger.info("T3: All dimensions built successfully")
+        self._log_dimension_metrics()
+        return True
+    
+    def _run_dimension_tasks(self, dimension_tasks: List[Tuple[str, Any]]) -> bool:
+        """Run dimension tasks concurrently, one worker per task"""
+        def run_task(task) -> bool:
+            dim_name, task_func = task
             self.logger.info(f"T3: Building {dim_name} dimension...")
             if not task_func():
                 self.logger.error(f"T3: Failed to build {dim_name} dimension")
                 return False
+            return True
         
-        self.logger.info("T3: All dimensions built successfully")
-        self._log_dimension_metrics()
-        return True
+        with ThreadPoolExecutor(max_workers=len(dimension_tasks)) as executor:
+            return all(list(executor.map(run_task, dimension_tasks)))
     
     def _build_time_dimension(self) -> bool:
         """T3.1: Build time dimension with hierarchical date attributes"""
-        conn = self.db_manager.get_connection()
+        conn = self.db_manager.open_connection()
         if not conn:
             return False
         
         try:
-            cursor = conn.cursor()
-            start_date = datetime.strptime(self.config.start_date, '%Y-%m-%d')
-            end_date = datetime.strptime(self.config.end_date, '%Y-%m-%d')
-            current_date = start_date
-            
-            inserted_count = 0
-            
-            while current_date <= end_date:
-                # Calculate hierarchical attributes
-                day_name = current_date.strftime('%A')
-                day_number = current_date.day
-                week_number = current_date.isocalendar()[1]
-                month_number = current_date.month
-                month_name = current_date.strftime('%B')
-                quarter_number = (current_date.month - 1) // 3 + 1
-                quarter_name = f"Q{quarter_number}"
-                year_number = current_date.year
-                is_weekend = 1 if current_date.weekday() >= 5 else 0
-                date_string = current_date.strftime('%Y-%m-%d')
-                
-                insert_sql = """
-                INSERT INTO DIM_Time 
-                (Date_Value, Day_Name, Day_Number, Week_Number, Month_Number, Month_Name,
-                 Quarter_Number, Quarter_Name, Year_Number, Is_Weekend, Date_String)
-                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-                """
-                
-                cursor.execute(insert_sql, (
-                    current_date.date(), day_name, day_number, week_number, 
-                    month_number, month_name, quarter_number, quarter_name, 
-                    year_number, is_weekend, date_string
-                ))
-                
-                inserted_count += 1
-                current_date += timedelta(days=1)
-            
-            conn.commit()
+            dates = pd.date_range(self.config.start_date, self.config.end_date, freq='D')
+            quarters = dates.quarter
+            
+            # Calculate hierarchical attributes for the whole range at once
+            time_df = pd.DataFrame({
+                'Date_Value': dates.date,
+                'Day_Name': dates.day_name(),
+                'Day_Number': dates.day,
+                'Week_Number': dates.isocalendar().week.to_numpy(dtype=int),
+                'Month_Number': dates.month,
+                'Month_Name': dates.month_name(),
+                'Quarter_Number': quarters,
+                'Quarter_Name': 'Q' + quarters.astype(str),
+                'Year_Number': dates.year,
+                'Is_Weekend': (dates.weekday >= 5).astype(int),
+                'Date_String': dates.strftime('%Y-%m-%d')
+            })
+            time_df.insert(0, 'Time_Key', _time_key(dates))
+            
+            inserted_count = self.db_manager.insert_dataframe(
+                conn, 'DIM_Time', time_df, self.config.batch_size
+            )
             self.metrics['time'] = {'records': inserted_count}
             return True
             
@@ -97,7 +179,14 @@ class T3_DimensionBuilder:
         return self._build_geographic_dimension(
             'customer', 'DIM_Customer', 
             self.data_extractor.get_dataframe('customers'),
-            'customer_id', 'customer_city', 'customer_state'
+            {
+                'customer_id': 'Customer_ID',
+                'customer_unique_id': 'Customer_Unique_ID',
+                'customer_zip_code_prefix': 'Customer_Zip_Code',
+                'customer_city': 'Customer_City',
+                'customer_state': 'Customer_State'
+            },
+            'customer_city', 'customer_state', 'Customer_Region'
         )
     
     def _build_seller_dimension(self) -> bool:
@@ -105,72 +194,59 @@ class T3_DimensionBuilder:
         return self._build_geographic_dimension(
             'seller', 'DIM_Seller',
             self.data_extractor.get_dataframe('sellers'),
-            'seller_id', 'seller_city', 'seller_state'
+            {
+                'seller_id': 'Seller_ID',
+                'seller_zip_code_prefix': 'Seller_Zip_Code',
+                'seller_city': 'Seller_City',
+                'seller_state': 'Seller_State'
+            },
+            'seller_city', 'seller_state', 'Seller_Region'
         )
     
     def _build_geographic_dimension(self, dim_type: str, table_name: str, 
-                                  source_df: pd.DataFrame, id_col: str, 
-                                  city_col: str, state_col: str) -> bool:
+                                  source_df: pd.DataFrame, column_map: Dict[str, str], 
+                                  city_col: str, state_col: str, region_col: str) -> bool:
         """Generic method for building geographic dimensions with fuzzy matching"""
-        conn = self.db_manager.get_connection()
+        key_col, id_col = f"{dim_type.title()}_Key", f"{dim_type.title()}_ID"
+        
+        # Dedicated connection, dimensions are built in parallel
+        conn = self.db_manager.open_connection()
         if not conn:
             return False
         
         try:
-            cursor = conn.cursor()
-            cities_df = self.data_extractor.get_dataframe('cities')
-            
-            # Brazil regions mapping
-            region_map = {
-                'AC': 'North', 'AL': 'Northeast', 'AP': 'North', 'AM': 'North', 'BA': 'Northeast',
-                'CE': 'Northeast', 'DF': 'Central-West', 'ES': 'Southeast', 'GO': 'Central-West',
-                'MA': 'Northeast', 'MT': 'Central-West', 'MS': 'Central-West', 'MG': 'Southeast',
-                'PA': 'North', 'PB': 'Northeast', 'PR': 'South', 'PE': 'Northeast', 'PI': 'Northeast',
-                'RJ': 'Southeast', 'RN': 'Northeast', 'RS': 'South', 'RO': 'North', 'RR': 'North',
-                'SC': 'South', 'SP': 'Southeast', 'SE': 'Northeast', 'TO': 'North'
-            }
-            
-            # Prepare cities data for fuzzy matching
-            cities_by_state = self._prepare_cities_data(cities_df)
+            # Match all cities up front, one vectorized scoring pass per state
+            entity_cities = source_df[city_col].astype(str).str.strip()
+            entity_states = source_df[state_col].astype(str).str.upper().str.strip()
+            city_rows, is_exact = self.quality_manager.fuzzy_match_cities(
+                entity_cities.tolist(), entity_states.tolist(), 
+                self._cities_by_state, self.config.fuzzy_threshold,
+                self._exact_index_by_state
+            )
+            matched = city_rows >= 0
             
             # Track matching statistics
-            stats = {'exact_matches': 0, 'fuzzy_matches': 0, 'no_matches': 0}
-            processed = 0
-            
-            for _, row in source_df.iterrows():
-                entity_city = str(row[city_col]).strip()
-                entity_state = str(row[state_col]).upper().strip()
-                
-                # Find matching city using fuzzy logic
-                city_data = self.quality_manager.fuzzy_match_city(
-                    entity_city, entity_state, cities_by_state, self.config.fuzzy_threshold
-                )
-                
-                # Update matching statistics
-                if city_data:
-                    normalized_entity = self.quality_manager.normalize_city_name(entity_city)
-                    if normalized_entity == city_data['normalized_name']:
-                        stats['exact_matches'] += 1
-                    else:
-                        stats['fuzzy_matches'] += 1
-                else:
-                    stats['no_matches'] += 1
-                
-                # Assign region
-                region = region_map.get(entity_state, 'Unknown')
-                
-                # Insert record
-                if dim_type == 'customer':
-                    self._insert_customer_record(cursor, row, region, city_data)
-                else:  # seller
-                    self._insert_seller_record(cursor, row, region, city_data)
-                
-                processed += 1
-                if processed % self.config.batch_size == 0:
-                    self.logger.info(f"T3: Processed {processed}/{len(source_df)} {dim_type}s...")
-                    conn.commit()
+            exact = int(is_exact.sum())
+            stats = {
+                'exact_matches': exact,
+                'fuzzy_matches': int(matched.sum()) - exact,
+                'no_matches': int((~matched).sum())
+            }
             
-            conn.commit()
+            # Stage the dimension as a DataFrame mirroring the table, gathering
+            # city attributes by matched row straight from the cities arrays
+            dim_df = source_df[list(column_map)].rename(columns=column_map).reset_index(drop=True)
+            dim_df.insert(0, key_col, np.arange(1, len(dim_df) + 1))
+            dim_df.insert(len(column_map) + 1, region_col, 
+                          entity_states.map(self.REGION_MAP).fillna('Unknown').to_numpy())
+            for column, key, default in self.CITY_COLUMNS:
+                dim_df[column] = np.where(matched, self._cities[key].to_numpy()[city_rows], default)
+            
+            inserted_count = self.db_manager.insert_dataframe(
+                conn, table_name, dim_df, self.config.batch_size
+            )
+            self.logger.info(f"T3: Inserted {inserted_count} {dim_type}s")
+            self.dim_keys[dim_type] = _key_lookup(dim_df, id_col, key_col)
             
             # Store metrics
             total_records = len(source_df)
@@ -187,121 +263,63 @@ class T3_DimensionBuilder:
         finally:
             conn.close()
     
-    def _prepare_cities_data(self, cities_df: pd.DataFrame) -> Dict[str, List[Dict]]:
-        """Prepare cities data grouped by state for fuzzy matching"""
-        cities_by_state = {}
+    def _build_cities_index(self) -> pd.DataFrame:
+        """Prepare cities attributes as columns, one row per city, for matching and lookups"""
+        cities_df = self.data_extractor.get_dataframe('cities')
         
-        for _, row in cities_df.iterrows():
-            state = str(row['STATE']).upper().strip()
-            if state not in cities_by_state:
-                cities_by_state[state] = []
-            
-            city_data = {
-                'original_name': row['CITY'],
-                'normalized_name': self.quality_manager.normalize_city_name(row['CITY']),
-                'state': state,
-                'population': row.get('IBGE_POP', 0) if pd.notna(row.get('IBGE_POP', 0)) else 0,
-                'gdp_capita': row.get('GDP_CAPITA', 0) if pd.notna(row.get('GDP_CAPITA', 0)) else 0,
-                'hdi': row.get('IDHM', 0) if pd.notna(row.get('IDHM', 0)) else 0,
-                'hdi_income': row.get('IDHM_Renda', 0) if pd.notna(row.get('IDHM_Renda', 0)) else 0,
-                'hdi_education': row.get('IDHM_Educacao', 0) if pd.notna(row.get('IDHM_Educacao', 0)) else 0,
-                'hdi_longevity': row.get('IDHM_Longevidade', 0) if pd.notna(row.get('IDHM_Longevidade', 0)) else 0,
-                'is_capital': 1 if row.get('CAPITAL', 0) == 1 else 0,
-                'category': str(row.get('CATEGORIA_TUR', 'None')) if pd.notna(row.get('CATEGORIA_TUR')) else 'None'
-            }
-            cities_by_state[state].append(city_data)
+        cities = pd.DataFrame({
+            'original_name': cities_df['CITY'],
+            'normalized_name': cities_df['CITY'].map(self.quality_manager.normalize_city_name),
+            'state': cities_df['STATE'].astype(str).str.upper().str.strip(),
+            'population': cities_df['IBGE_POP'],
+            'gdp_capita': cities_df['GDP_CAPITA'],
+            'hdi': cities_df['IDHM'],
+            'hdi_income': cities_df['IDHM_Renda'],
+            'hdi_education': cities_df['IDHM_Educacao'],
+            'hdi_longevity': cities_df['IDHM_Longevidade'],
+            'is_capital': (cities_df['CAPITAL'] == 1).astype(int),
+            'category': cities_df['CATEGORIA_TUR']
+        }).fillna({
+            'population': 0, 'gdp_capita': 0, 'hdi': 0, 'hdi_income': 0,
+            'hdi_education': 0, 'hdi_longevity': 0, 'category': 'None'
+        })
+        cities['category'] = cities['category'].astype(str)
         
-        return cities_by_state
-    
-    def _insert_customer_record(self, cursor, customer, region: str, city_data: Dict):
-        """Insert customer record with city data"""
-        insert_sql = """
-        INSERT INTO DIM_Customer 
-        (Customer_ID, Customer_Unique_ID, Customer_Zip_Code, Customer_City, Customer_State, Customer_Region,
-         City_Population, City_GDP_Per_Capita, City_HDI, City_HDI_Income, City_HDI_Education, 
-         City_HDI_Longevity, City_Is_Capital, City_Category)
-        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-        """
-        
-        cursor.execute(insert_sql, (
-            customer['customer_id'],
-            customer.get('customer_unique_id', ''),
-            customer.get('customer_zip_code_prefix', ''),
-            customer['customer_city'],
-            customer['customer_state'],
-            region,
-            city_data.get('population', 0),
-            city_data.get('gdp_capita', 0),
-            city_data.get('hdi', 0),
-            city_data.get('hdi_income', 0),
-            city_data.get('hdi_education', 0),
-            city_data.get('hdi_longevity', 0),
-            city_data.get('is_capital', 0),
-            city_data.get('category', 'None')
-        ))
-    
-    def _insert_seller_record(self, cursor, seller, region: str, city_data: Dict):
-        """Insert seller record with city data"""
-        insert_sql = """
-        INSERT INTO DIM_Seller 
-        (Seller_ID, Seller_Zip_Code, Seller_City, Seller_State, Seller_Region,
-         City_Population, City_GDP_Per_Capita, City_HDI, City_HDI_Income, City_HDI_Education, 
-         City_HDI_Longevity, City_Is_Capital, City_Category)
-        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-        """
+        # Stage with the narrowest dtypes the target columns need; GDP keeps
+        # float64 since DECIMAL(15,2) exceeds float32's ~7 significant digits
+        cities = cities.astype({
+            'population': np.int32, 'hdi': np.float32, 'hdi_income': np.float32,
+            'hdi_education': np.float32, 'hdi_longevity': np.float32, 'is_capital': np.int8
+        })
         
-        cursor.execute(insert_sql, (
-            seller['seller_id'],
-            seller.get('seller_zip_code_prefix', ''),
-            seller['seller_city'],
-            seller['seller_state'],
-            region,
-            city_data.get('population', 0),
-            city_data.get('gdp_capita', 0),
-            city_data.get('hdi', 0),
-            city_data.get('hdi_income', 0),
-            city_data.get('hdi_education', 0),
-            city_data.get('hdi_longevity', 0),
-            city_data.get('is_capital', 0),
-            city_data.get('category', 'None')
-        ))
+        return cities.reset_index(drop=True)
     
     def _build_payment_dimension(self) -> bool:
         """T3.4: Build payment dimension with categorization"""
-        conn = self.db_manager.get_connection()
+        conn = self.db_manager.open_connection()
         if not conn:
             return False
         
         try:
-            cursor = conn.cursor()
             payments_df = self.data_extractor.get_dataframe('payments')
             
             # Get unique payment combinations
             unique_payments = payments_df[['payment_type', 'payment_installments']].drop_duplicates()
-            
-            for _, payment in unique_payments.iterrows():
-                payment_type = payment['payment_type']
-                installments = payment['payment_installments']
-                
-                # Categorize payment type
-                payment_category, is_credit = self._categorize_payment_type(payment_type)
-                
-                # Categorize installments
-                installments_range = self._categorize_installments(installments)
-                is_installment = 1 if installments > 1 else 0
-                
-                insert_sql = """
-                INSERT INTO DIM_Payment 
-                (Payment_Type, Payment_Category, Installments_Range, Is_Credit, Is_Installment)
-                VALUES (?, ?, ?, ?, ?)
-                """
-                
-                cursor.execute(insert_sql, (
-                    payment_type, payment_category, installments_range, 
-                    is_credit, is_installment
-                ))
-            
-            conn.commit()
+            payment_types = unique_payments['payment_type'].astype(object)
+            installments = unique_payments['payment_installments']
+            
+            # Categorize payment types and installment ranges column-wise
+            payment_df = pd.DataFrame({
+                'Payment_Type': payment_types,
+                'Payment_Category': payment_types.map(PAYMENT_CATEGORIES).fillna('Other'),
+                'Installments_Range': _installments_range(installments),
+                'Is_Credit': (payment_types == 'credit_card').astype(int),
+                'Is_Installment': (installments > 1).astype(int)
+            })
+            payment_df.insert(0, 'Payment_Key', np.arange(1, len(payment_df) + 1))
+            
+            self.db_manager.insert_dataframe(conn, 'DIM_Payment', payment_df, self.config.batch_size)
+            self.dim_keys['payment'] = _payment_key_lookup(payment_df)
             self.metrics['payment'] = {'records': len(unique_payments)}
             return True
             
@@ -312,71 +330,41 @@ class T3_DimensionBuilder:
         finally:
             conn.close()
     
-    def _categorize_payment_type(self, payment_type: str) -> Tuple[str, int]:
-        """Categorize payment type and determine if it's credit"""
-        if payment_type == 'credit_card':
-            return 'Credit Card', 1
-        elif payment_type == 'boleto':
-            return 'Boleto', 0
-        elif payment_type == 'voucher':
-            return 'Voucher', 0
-        elif payment_type == 'debit_card':
-            return 'Debit Card', 0
-        else:
-            return 'Other', 0
-    
-    def _categorize_installments(self, installments: int) -> str:
-        """Categorize installment ranges"""
-        if installments == 1:
-            return '1 installment'
-        elif installments <= 3:
-            return '2-3 installments'
-        elif installments <= 6:
-            return '4-6 installments'
-        elif installments <= 12:
-            return '7-12 installments'
-        else:
-            return '13+ installments'
-    
     def _build_review_dimension(self) -> bool:
         """T3.5: Build review dimension with satisfaction categorization"""
-        conn = self.db_manager.get_connection()
+        conn = self.db_manager.open_connection()
         if not conn:
             return False
         
         try:
-            cursor = conn.cursor()
             reviews_df = self.data_extractor.get_dataframe('reviews')
             
             # Get unique review combinations
-            review_pairs = set()
-            for _, row in reviews_df.iterrows():
-                score = row.get('review_score', 0)
-                comment = row.get('review_comment_message', '')
-                comment_category = self._categorize_comment_length(comment)
-                review_pairs.add((score, comment_category))
-            
-            # Insert each unique combination
-            for score, comment_category in review_pairs:
-                review_category, satisfaction_level = self._categorize_review_score(score)
-                has_comment = 0 if comment_category == 'No Comment' else 1
-                
-                insert_sql = """
-                INSERT INTO DIM_Review 
-                (Review_Score, Review_Category, Satisfaction_Level, Has_Comment, Comment_Length_Category)
-                VALUES (?, ?, ?, ?, ?)
-                """
-                
-                cursor.execute(insert_sql, (
-                    score, review_category, satisfaction_level, 
-                    has_comment, comment_category
-                ))
+            comments = reviews_df['review_comment_message'].fillna('').astype(str)
+            lengths = comments.str.len().where(comments.str.strip() != '', 0)
+            review_pairs = pd.DataFrame({
+                'Review_Score': reviews_df['review_score'],
+                'Comment_Length_Category': pd.cut(lengths, bins=COMMENT_LENGTH_BINS, 
+                                                  labels=COMMENT_LENGTH_LABELS, right=False).astype(str)
+            }).drop_duplicates().reset_index(drop=True)
+            
+            # Categorize scores column-wise, unknown scores count as no review
+            score_categories = review_pairs['Review_Score'].map(REVIEW_SCORE_CATEGORIES)
+            review_df = pd.DataFrame({
+                'Review_Score': review_pairs['Review_Score'],
+                'Review_Category': score_categories.str[0].fillna('No review'),
+                'Satisfaction_Level': score_categories.str[1].fillna('Unknown'),
+                'Has_Comment': (review_pairs['Comment_Length_Category'] != 'No Comment').astype(int),
+                'Comment_Length_Category': review_pairs['Comment_Length_Category']
+            })
             
             # Add record for no review
-            cursor.execute(insert_sql, (0, 'No review', 'Unknown', 0, 'No Comment'))
+            review_df.loc[len(review_df)] = [0, 'No review', 'Unknown', 0, 'No Comment']
+            review_df.insert(0, 'Review_Key', np.arange(1, len(review_df) + 1))
             
-            conn.commit()
-            self.metrics['review'] = {'records': len(review_pairs) + 1}
+            self.db_manager.insert_dataframe(conn, 'DIM_Review', review_df, self.config.batch_size)
+            self.dim_keys['review'] = _key_lookup(review_df, 'Review_Score', 'Review_Key')
+            self.metrics['review'] = {'records': len(review_df)}
             return True
             
         except Exception as e:
@@ -386,34 +374,6 @@ class T3_DimensionBuilder:
         finally:
             conn.close()
     
-    def _categorize_comment_length(self, comment: str) -> str:
-        """Categorize comment by length"""
-        if pd.isna(comment) or not comment or str(comment).strip() == '':
-            return 'No Comment'
-        
-        length = len(str(comment))
-        if length < 30:
-            return 'Short (<30)'
-        elif length < 50:
-            return 'Medium (30-49)'
-        elif length < 100:
-            return 'Long (50-99)'
-        elif length < 200:
-            return 'Very Long (100-199)'
-        else:
-            return 'Extremely Long (200+)'
-    
-    def _categorize_review_score(self, score: int) -> Tuple[str, str]:
-        """Categorize review score into satisfaction levels"""
-        if score <= 2:
-            return 'Negative', 'Unsatisfied'
-        elif score == 3:
-            return 'Neutral', 'Neutral'
-        elif score >= 4:
-            return 'Positive', 'Satisfied'
-        else:
-            return 'No review', 'Unknown'
-    
     def _log_dimension_metrics(self):
         """Log dimension building metrics"""
         self.logger.info("T3: Dimension Building Metrics:")
@@ -431,12 +391,53 @@ class T3_DimensionBuilder:
 class T4_FactBuilder:
     """Task 4: Build fact table with denormalized measures"""
     
+    # Pre-aggregated rollups persisted after the fact load: (table, select, group-by columns)
+    ROLLUP_DEFINITIONS = [
+        ("MV_Monthly_Revenue", """
+            SELECT t.Year_Number, t.Month_Number, c.Customer_State,
+                   SUM(f.Order_Value) AS Revenue,
+                   SUM(f.Freight_Value) AS Freight,
+                   AVG(CAST(f.Delivery_Days AS FLOAT)) AS Avg_Delivery_Days,
+                   AVG(CAST(f.Review_Score AS FLOAT)) AS Avg_Review_Score,
+                   COUNT(*) AS Orders_Count
+            INTO MV_Monthly_Revenue
+            FROM FACT_Orders f
+            JOIN DIM_Time t ON f.Time_Key = t.Time_Key
+            JOIN DIM_Customer c ON f.Customer_Key = c.Customer_Key
+            GROUP BY t.Year_Number, t.Month_Number, c.Customer_State
+        """, ['Year_Number', 'Month_Number', 'Customer_State']),
+        ("MV_Seller_State_KPI", """
+            SELECT s.Seller_State, s.Seller_Region,
+                   SUM(f.Order_Value) AS Revenue,
+                   AVG(CAST(f.Delivery_Days AS FLOAT)) AS Avg_Delivery_Days,
+                   AVG(CAST(f.Review_Score AS FLOAT)) AS Avg_Review_Score,
+                   COUNT(DISTINCT f.Seller_Key) AS Sellers_Count,
+                   COUNT(*) AS Orders_Count
+            INTO MV_Seller_State_KPI
+            FROM FACT_Orders f
+            JOIN DIM_Seller s ON f.Seller_Key = s.Seller_Key
+            GROUP BY s.Seller_State, s.Seller_Region
+        """, ['Seller_State']),
+        ("MV_Payment_Category_Quarter", """
+            SELECT t.Year_Number, t.Quarter_Number, p.Payment_Category,
+                   SUM(f.Order_Value) AS Revenue,
+                   COUNT(*) AS Orders_Count
+            INTO MV_Payment_Category_Quarter
+            FROM FACT_Orders f
+            JOIN DIM_Time t ON f.Time_Key = t.Time_Key
+            JOIN DIM_Payment p ON f.Payment_Key = p.Payment_Key
+            GROUP BY t.Year_Number, t.Quarter_Number, p.Payment_Category
+        """, ['Year_Number', 'Quarter_Number', 'Payment_Category'])
+    ]
+    
     def __init__(self, config: ETLConfig, logger: ETLLogger, 
-                 db_manager: DatabaseManager, data_extractor: T1_DataExtractor):
+                 db_manager: DatabaseManager, data_extractor: T1_DataExtractor,
+                 dim_keys: Dict[str, Any] = None):
         self.config = config
         self.logger = logger
         self.db_manager = db_manager
         self.data_extractor = data_extractor
+        self.dim_keys = dim_keys
     
     def execute(self) -> bool:
         """Execute fact table building process"""
@@ -449,8 +450,8 @@ class T4_FactBuilder:
                 self.logger.error("T4: No fact data prepared")
                 return False
             
-            # Get dimension lookup tables
-            dim_keys = self._get_dimension_keys()
+            # Get dimension lookup tables, kept in memory by T3 or read back from the warehouse
+            dim_keys = self.dim_keys or self._get_dimension_keys()
             if not dim_keys:
                 self.logger.error("T4: Failed to retrieve dimension keys")
                 return False
@@ -467,41 +468,50 @@ class T4_FactBuilder:
             self.logger.error(f"T4: Fact table building failed: {e}")
             return False
     
+    def build_rollups(self) -> bool:
+        """Materialize the pre-aggregated rollup tables from the loaded fact table"""
+        conn = self.db_manager.get_connection()
+        if not conn:
+            return False
+        
+        try:
+            cursor = conn.cursor()
+            
+            for table_name, select_sql, group_columns in self.ROLLUP_DEFINITIONS:
+                cursor.execute(select_sql)
+                cursor.execute(f"CREATE INDEX IX_{table_name} ON {table_name} ({', '.join(group_columns)});")
+                self.logger.info(f"T4: Built rollup {table_name}")
+            
+            conn.commit()
+            return True
+            
+        except Exception as e:
+            self.logger.error(f"T4: Rollup building failed: {e}")
+            conn.rollback()
+            return False
+    
     def _prepare_fact_data(self) -> Optional[pd.DataFrame]:
         """Prepare fact data by joining source tables"""
         try:
             self.logger.info("T4: Joining source data for fact table...")
             
             orders_df = self.data_extractor.get_dataframe('orders')
-            order_items_df = self.data_extractor.get_dataframe('order_items')
-            payments_df = self.data_extractor.get_dataframe('payments')
             reviews_df = self.data_extractor.get_dataframe('reviews')
             
-            # Aggregate order items by order
-            items_agg = order_items_df.groupby('order_id').agg({
-                'price': 'sum',
-                'freight_value': 'sum',
-                'order_item_id': 'count',
-                'seller_id': 'first'  # Take first seller for the order
-            }).reset_index()
-            
-            # Join orders with items
-            fact_data = orders_df.merge(items_agg, on='order_id', how='inner')
-            
-            # Aggregate payments by order
-            payments_agg = payments_df.groupby('order_id').agg({
-                'payment_type': 'first',
-                'payment_installments': 'first',
-                'payment_value': 'sum'
-            }).reset_index()
-            
-            # Join with payments
-            fact_data = fact_data.merge(payments_agg, on='order_id', how='left')
-            
-            # Join with reviews
-            fact_data = fact_data.merge(
-                reviews_df[['order_id', 'review_score']], 
-                on='order_id', how='left'
+            # Item and payment aggregates per order are precomputed by T1
+            items_agg = self.data_extractor.get_dataframe('items_agg')
+            payments_agg = self.data_extractor.get_dataframe('payments_agg')
+            
+            # Join everything on the order_id index; orders need items, while
+            # payments and reviews are optional (an order may have several reviews).
+            # validate guards the key cardinality each join relies on
+            fact_data = (
+                orders_df.set_index('order_id')
+                .join(items_agg, how='inner', validate='one_to_one')
+                .join(payments_agg, how='left', validate='one_to_one')
+                .join(reviews_df.set_index('order_id')[['review_score']], how='left', 
+                      validate='one_to_many')
+                .reset_index()
             )
             
             self.logger.info(f"T4: Prepared {len(fact_data)} fact records")
@@ -511,46 +521,36 @@ class T4_FactBuilder:
             self.logger.error(f"T4: Failed to prepare fact data: {e}")
             return None
     
-    def _get_dimension_keys(self) -> Dict[str, Dict]:
+    def _get_dimension_keys(self) -> Dict[str, Any]:
         """Retrieve dimension key mappings"""
         conn = self.db_manager.get_connection()
         if not conn:
             return {}
         
         try:
-            cursor = conn.cursor()
             dim_keys = {}
             
-            # Time keys
-            cursor.execute("SELECT Time_Key, Date_Value FROM DIM_Time")
-            dim_keys['time'] = {row[1]: row[0] for row in cursor.fetchall()}
-            
-            # Customer keys
-            cursor.execute("SELECT Customer_Key, Customer_ID FROM DIM_Customer")
-            dim_keys['customer'] = {row[1]: row[0] for row in cursor.fetchall()}
-            
-            # Seller keys
-            cursor.execute("SELECT Seller_Key, Seller_ID FROM DIM_Seller")
-            dim_keys['seller'] = {row[1]: row[0] for row in cursor.fetchall()}
-            
-            # Payment keys
-            cursor.execute("SELECT Payment_Key, Payment_Type, Installments_Range FROM DIM_Payment")
-            payment_keys = {}
-            for row in cursor.fetchall():
-                payment_keys[f"{row[1]}_{row[2]}"] = row[0]
-            dim_keys['payment'] = payment_keys
+            # Natural key -> surrogate key Series, used as vectorized lookups via map
+            key_queries = {
+                'customer': ("SELECT Customer_ID, Customer_Key FROM DIM_Customer", 'Customer_ID', 'Customer_Key'),
+                'seller': ("SELECT Seller_ID, Seller_Key FROM DIM_Seller", 'Seller_ID', 'Seller_Key'),
+                'review': ("SELECT Review_Score, Review_Key FROM DIM_Review", 'Review_Score', 'Review_Key')
+            }
+            for dim_name, (sql, natural_key, surrogate_key) in key_queries.items():
+                keys_df = self.db_manager.query_dataframe(conn, sql)
+                dim_keys[dim_name] = _key_lookup(keys_df, natural_key, surrogate_key)
             
-            # Review keys
-            cursor.execute("SELECT Review_Key, Review_Score FROM DIM_Review")
-            dim_keys['review'] = {row[1]: row[0] for row in cursor.fetchall()}
+            # Payment keys, merged on (type, range); several installment counts share a range
+            payment_keys = self.db_manager.query_dataframe(
+                conn, "SELECT Payment_Key, Payment_Type, Installments_Range FROM DIM_Payment"
+            )
+            dim_keys['payment'] = _payment_key_lookup(payment_keys)
             
             return dim_keys
             
         except Exception as e:
             self.logger.error(f"T4: Failed to retrieve dimension keys: {e}")
             return {}
-        finally:
-            conn.close()
     
     def _load_fact_records(self, fact_data: pd.DataFrame, dim_keys: Dict) -> bool:
         """Load fact records with dimension key lookups"""
@@ -559,71 +559,66 @@ class T4_FactBuilder:
             return False
         
         try:
-            cursor = conn.cursor()
-            inserted_count = 0
-            error_count = 0
-            
-            for _, row in fact_data.iterrows():
-                try:
-                    # Process dates and calculate measures
-                    purchase_date = pd.to_datetime(row['order_purchase_timestamp']).date()
-                    delivery_date = pd.to_datetime(row.get('order_delivered_customer_date', None), errors='coerce')
-                    estimated_delivery = pd.to_datetime(row.get('order_estimated_delivery_date', None), errors='coerce')
-                    
-                    # Calculate delivery days
-                    delivery_days = None
-                    if delivery_date is not None and not pd.isna(delivery_date):
-                        delivery_days = (delivery_date.date() - purchase_date).days
-                        delivery_date = delivery_date.date()
-                    else:
-                        delivery_date = None
-                    
-                    if estimated_delivery is not None and not pd.isna(estimated_delivery):
-                        estimated_delivery = estimated_delivery.date()
-                    else:
-                        estimated_delivery = None
-                    
-                    # Lookup dimension keys
-                    time_key = dim_keys['time'].get(purchase_date)
-                    customer_key = dim_keys['customer'].get(row['customer_id'])
-                    seller_key = dim_keys['seller'].get(row.get('seller_id'))
-                    
-                    # Get payment key
-                    payment_type = row.get('payment_type', 'unknown')
-                    installments = row.get('payment_installments', 1)
-                    installments_range = self._get_installments_range(installments)
-                    payment_key = dim_keys['payment'].get(f"{payment_type}_{installments_range}")
-                    
-                    # Get review key
-                    review_score = row.get('review_score', 0)
-                    if pd.isna(review_score):
-                        review_score = 0
-                    review_key = dim_keys['review'].get(int(review_score))
-                    
-                    # Only insert if all keys are found
-                    if all([time_key, customer_key, seller_key, payment_key, review_key]):
-                        self._insert_fact_record(
-                            cursor, row, time_key, customer_key, seller_key,
-                            payment_key, review_key, delivery_days, review_score,
-                            purchase_date, delivery_date, estimated_delivery
-                        )
-                        inserted_count += 1
-                        
-                        if inserted_count % self.config.batch_size == 0:
-                            self.logger.info(f"T4: Inserted {inserted_count} records...")
-                            conn.commit()
-                    else:
-                        error_count += 1
-                        if error_count <= 5:  # Log first few errors
-                            self.logger.warning(f"T4: Missing keys for order {row['order_id']}")
-                
-                except Exception as e:
-                    error_count += 1
-                    if error_count <= 5:
-                        self.logger.warning(f"T4: Error processing order {row['order_id']}: {e}")
-                    continue
-            
-            conn.commit()
+            # T1 parses the timestamps; truncate them to day resolution since delivery
+            # days count calendar days and object casts give datetime.date (None for NaT)
+            purchase_days = fact_data['order_purchase_timestamp'].to_numpy(dtype='datetime64[D]')
+            delivered_days = fact_data['order_delivered_customer_date'].to_numpy(dtype='datetime64[D]')
+            estimated_days = fact_data['order_estimated_delivery_date'].to_numpy(dtype='datetime64[D]')
+            day_spans = delivered_days - purchase_days
+            delivery_days = pd.arrays.IntegerArray(day_spans.astype(np.int64), np.isnat(day_spans))
+            purchase_dates = pd.Series(purchase_days.astype(object), index=fact_data.index)
+            
+            # Resolve every dimension key for the whole frame at once; Time_Key is
+            # derived from the date and only valid inside the DIM_Time range
+            in_time_range = ((purchase_days >= np.datetime64(self.config.start_date)) &
+                             (purchase_days <= np.datetime64(self.config.end_date)))
+            review_scores = fact_data['review_score'].fillna(0)
+            payment_keys = dim_keys['payment']
+            # Share the key frame's categories so the merge joins on integer codes
+            payments = pd.DataFrame({
+                'Payment_Type': fact_data['payment_type'].to_numpy(),
+                'Installments_Range': _installments_range(fact_data['payment_installments'])
+            }).astype(payment_keys.dtypes[['Payment_Type', 'Installments_Range']].to_dict())
+            fact_keys = pd.DataFrame({
+                'time_key': pd.Series(_time_key(pd.DatetimeIndex(purchase_days))).where(in_time_range).to_numpy(),
+                'customer_key': fact_data['customer_id'].map(dim_keys['customer']).to_numpy(),
+                'seller_key': fact_data['seller_id'].map(dim_keys['seller']).to_numpy(),
+                'payment_key': payments.merge(payment_keys, how='left', validate='many_to_one',
+                                              on=['Payment_Type', 'Installments_Range'])['Payment_Key'].to_numpy(),
+                'review_key': review_scores.astype(int).map(dim_keys['review']).to_numpy()
+            }, index=fact_data.index)
+            
+            # Only insert rows where all keys are found
+            has_keys = fact_keys.notna().all(axis=1)
+            error_count = int((~has_keys).sum())
+            for order_id in fact_data.loc[~has_keys, 'order_id'].head(5):  # Log first few errors
+                self.logger.warning(f"T4: Missing keys for order {order_id}")
+            
+            # Stage the fact table as a DataFrame mirroring FACT_Orders
+            fact_df = pd.DataFrame({
+                'Order_ID': fact_data['order_id'],
+                'Time_Key': fact_keys['time_key'],
+                'Customer_Key': fact_keys['customer_key'],
+                'Seller_Key': fact_keys['seller_key'],
+                'Payment_Key': fact_keys['payment_key'],
+                'Review_Key': fact_keys['review_key'],
+                'Order_Value': fact_data['price'],
+                'Freight_Value': fact_data['freight_value'],
+                'Items_Count': fact_data['order_item_id'],
+                'Delivery_Days': delivery_days,
+                'Review_Score': review_scores.where(review_scores > 0).astype('Int64'),
+                'Purchase_Date': purchase_dates,
+                'Delivery_Date': delivered_days.astype(object),
+                'Estimated_Delivery_Date': estimated_days.astype(object)
+            })[has_keys]
+            key_columns = ['Time_Key', 'Customer_Key', 'Seller_Key', 'Payment_Key', 'Review_Key']
+            fact_df[key_columns] = fact_df[key_columns].astype(int)
+            
+            # Bulk insert in batch_size chunks under one table lock, committed once;
+            # foreign keys are only created after the load
+            inserted_count = self.db_manager.insert_dataframe(
+                conn, 'FACT_Orders', fact_df, self.config.batch_size, table_lock=True
+            )
             self.logger.info(f"T4: Fact table loaded: {inserted_count} records, {error_count} errors")
             
             # Log success rate
@@ -637,47 +632,3 @@ class T4_FactBuilder:
             self.logger.error(f"T4: Fact loading failed: {e}")
             conn.rollback()
             return False
-        finally:
-            conn.close()
-    
-    def _get_installments_range(self, installments: int) -> str:
-        """Get installments range category"""
-        if installments == 1:
-            return '1 installment'
-        elif installments <= 3:
-            return '2-3 installments'
-        elif installments <= 6:
-            return '4-6 installments'
-        elif installments <= 12:
-            return '7-12 installments'
-        else:
-            return '13+ installments'
-    
-    def _insert_fact_record(self, cursor, row, time_key, customer_key, seller_key,
-                          payment_key, review_key, delivery_days, review_score,
-                          purchase_date, delivery_date, estimated_delivery):
-        """Insert single fact record"""
-        insert_sql = """
-        INSERT INTO FACT_Orders 
-        (Order_ID, Time_Key, Customer_Key, Seller_Key, Payment_Key, Review_Key,
-         Order_Value, Freight_Value, Items_Count, Delivery_Days, Review_Score,
-         Purchase_Date, Delivery_Date, Estimated_Delivery_Date)
-        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-        """
-        
-        cursor.execute(insert_sql, (
-            row['order_id'],
-            time_key,
-            customer_key,
-            seller_key,
-            payment_key,
-            review_key,
-            float(row.get('price', 0)),
-            float(row.get('freight_value', 0)),
-            int(row.get('order_item_id', 1)),
-            delivery_days,
-            int(review_score) if review_score > 0 else None,
-            purchase_date,
-            delivery_date,
-            estimated_delivery
-        ))
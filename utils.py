@@ -1,13 +1,25 @@
 import pyodbc
+import numpy as np
 import pandas as pd
 from datetime import datetime
 import logging
+import unicodedata
+from functools import lru_cache
 from typing import Dict, List, Tuple, Optional, Any
 from dataclasses import dataclass
-from fuzzywuzzy import fuzz, process
-from unidecode import unidecode
+from rapidfuzz import fuzz, process
+from rapidfuzz.utils import default_process
 from config import ETLConfig
 
+# Quotes are dropped and separators become spaces in a single translate pass;
+# typographic apostrophes are included so NFKD does not split them into spaces
+_CITY_NAME_TRANSLATION = str.maketrans({
+    "'": "", '"': "", "´": "", "`": "", "’": "", "-": " ", "_": " "
+})
+
+# ODBC connection attribute id, only honoured when set before connecting
+_SQL_ATTR_PACKET_SIZE = 112
+
 @dataclass 
 class ETLMetrics:
     """Class to track ETL process metrics"""
@@ -71,10 +83,15 @@ class ETLLogger:
 class DatabaseManager:
     """Database connection and management utilities"""
     
+    # SQL Server limits: 2100 parameters per request, 1000 rows per VALUES list
+    MAX_PARAMETERS = 2100
+    MAX_VALUES_ROWS = 1000
+    
     def __init__(self, config: ETLConfig, logger: ETLLogger):
         self.config = config
         self.logger = logger
         self.connection_string = self._build_connection_string()
+        self._connection = None
     
     def _build_connection_string(self) -> str:
         """Build database connection string"""
@@ -88,15 +105,90 @@ class DatabaseManager:
         )
     
     def get_connection(self) -> Optional[pyodbc.Connection]:
-        """Establish database connection with error handling"""
+        """Return the shared database connection, establishing it on first use"""
+        if self._connection is not None:
+            return self._connection
+        
+        self._connection = self.open_connection()
+        return self._connection
+    
+    def open_connection(self) -> Optional[pyodbc.Connection]:
+        """Establish a dedicated database connection, closed by the caller"""
         try:
-            conn = pyodbc.connect(self.connection_string)
+            conn = pyodbc.connect(self.connection_string, autocommit=False,
+                                  attrs_before={_SQL_ATTR_PACKET_SIZE: self.config.packet_size})
+            # Skip the "rows affected" message SQL Server sends back for every statement
+            conn.execute("SET NOCOUNT ON")
             self.logger.info("Database connection established successfully")
             return conn
         except Exception as e:
             self.logger.error(f"Failed to connect to database: {e}")
             return None
     
+    def close(self):
+        """Close the shared database connection"""
+        if self._connection is not None:
+            self._connection.close()
+            self._connection = None
+            self.logger.info("Database connection closed")
+    
+    def execute_batches(self, conn: pyodbc.Connection, sql: str, 
+                        rows: List[Tuple], batch_size: int) -> int:
+        """Execute parameterized SQL for many rows using fast_executemany batches.
+        
+        All batches run in one transaction (autocommit is off), committed once at the end.
+        """
+        cursor = conn.cursor()
+        cursor.fast_executemany = True
+        
+        for start in range(0, len(rows), batch_size):
+            cursor.executemany(sql, rows[start:start + batch_size])
+        
+        conn.commit()
+        return len(rows)
+    
+    def query_dataframe(self, conn: pyodbc.Connection, sql: str) -> pd.DataFrame:
+        """Run a query and return its result set as a DataFrame"""
+        cursor = conn.cursor()
+        cursor.execute(sql)
+        columns = [column[0] for column in cursor.description]
+        return pd.DataFrame.from_records([tuple(row) for row in cursor.fetchall()], columns=columns)
+    
+    def insert_dataframe(self, conn: pyodbc.Connection, table_name: str, 
+                         df: pd.DataFrame, batch_size: int, table_lock: bool = False) -> int:
+        """Bulk insert a DataFrame whose columns mirror the target table.
+        
+        Rows are converted and bound one chunk at a time, so only batch_size rows
+        exist as Python tuples at once; the whole load is committed once.
+        Tables small enough for one multi-row VALUES statement go in a single execute.
+        table_lock takes a single table lock (TABLOCK) instead of per-row locks.
+        """
+        columns = ', '.join(df.columns)
+        placeholders = f"({', '.join(['?'] * len(df.columns))})"
+        hint = " WITH (TABLOCK)" if table_lock else ""
+        sql = f"INSERT INTO {table_name}{hint} ({columns}) VALUES "
+        
+        cursor = conn.cursor()
+        
+        if 0 < len(df) <= self.MAX_VALUES_ROWS and df.size < self.MAX_PARAMETERS:
+            values = df.astype(object).where(df.notna(), None)
+            params = [value for row in values.itertuples(index=False, name=None) for value in row]
+            cursor.execute(sql + ', '.join([placeholders] * len(df)), params)
+            conn.commit()
+            return len(df)
+        
+        sql += placeholders
+        cursor.fast_executemany = True
+        
+        for start in range(0, len(df), batch_size):
+            chunk = df.iloc[start:start + batch_size]
+            # pyodbc binds native Python values only, missing values go in as NULL
+            values = chunk.astype(object).where(chunk.notna(), None)
+            cursor.executemany(sql, list(values.itertuples(index=False, name=None)))
+        
+        conn.commit()
+        return len(df)
+    
     def execute_sql(self, sql: str, params: Tuple = None) -> bool:
         """Execute SQL statement with error handling"""
         conn = self.get_connection()
@@ -115,8 +207,6 @@ class DatabaseManager:
             self.logger.error(f"SQL execution failed: {e}")
             conn.rollback()
             return False
-        finally:
-            conn.close()
 
 
 class DataQualityManager:
@@ -150,49 +240,112 @@ class DataQualityManager:
             self.logger.error(f"DataFrame validation failed for {table_name}: {e}")
             return False
     
-    def normalize_city_name(self, city_name: str) -> str:
-        """Normalize city name for fuzzy matching"""
+    @staticmethod
+    @lru_cache(maxsize=65536)
+    def normalize_city_name(city_name: str) -> str:
+        """Normalize city name for fuzzy matching (cached, city names repeat heavily)"""
         if pd.isna(city_name) or not city_name:
             return ""
         
-        # Convert to string and normalize
-        normalized = str(city_name).lower().strip()
-        # Remove accents
-        normalized = unidecode(normalized)
-        # Clean up special characters
-        replacements = {"'": "", '"': "", "-": " ", "_": " "}
-        
-        for old, new in replacements.items():
-            normalized = normalized.replace(old, new)
-        
-        # Remove multiple spaces
-        normalized = " ".join(normalized.split())
-        return normalized
+        # Lowercase, clean up special characters, remove accents, collapse spaces
+        normalized = str(city_name).lower().strip().translate(_CITY_NAME_TRANSLATION)
+        normalized = unicodedata.normalize('NFKD', normalized).encode('ascii', 'ignore').decode('ascii')
+        return " ".join(normalized.split())
+    
+    def group_cities_by_state(self, normalized_names: pd.Series, 
+                              states: pd.Series) -> Dict[str, Dict[str, np.ndarray]]:
+        """Group cities per state as parallel arrays of normalized names and row positions"""
+        cities_by_state = {}
+        grouped = pd.DataFrame({'name': normalized_names.to_numpy(), 'state': states.to_numpy()})
+        for state, group in grouped.groupby('state', sort=False):
+            cities_by_state[state] = {
+                'names': group['name'].to_numpy(dtype=object),
+                'rows': group.index.to_numpy(dtype=np.int64)
+            }
+        return cities_by_state
+    
+    def build_exact_city_index(self, cities_by_state: Dict) -> Dict[str, Dict[str, int]]:
+        """Index city rows by normalized name within each state for exact-match lookups"""
+        exact_index_by_state = {}
+        for state, state_cities in cities_by_state.items():
+            state_index = {}
+            for name, row in zip(state_cities['names'], state_cities['rows']):
+                # First occurrence wins, same as scanning the state's cities in order
+                state_index.setdefault(name, int(row))
+            exact_index_by_state[state] = state_index
+        return exact_index_by_state
     
     def fuzzy_match_city(self, target_city: str, target_state: str, 
-                        cities_by_state: Dict, threshold: int = 80) -> Dict[str, Any]:
-        """Find best matching city using fuzzy matching"""
+                        cities_by_state: Dict, threshold: int = 80,
+                        exact_index_by_state: Dict = None) -> int:
+        """Find the row of the best matching city using fuzzy matching, -1 if none"""
         if target_state not in cities_by_state:
-            return {}
+            return -1
         
         normalized_target = self.normalize_city_name(target_city)
         if not normalized_target:
-            return {}
+            return -1
         
         state_cities = cities_by_state[target_state]
+        if exact_index_by_state is None:
+            exact_index_by_state = self.build_exact_city_index({target_state: state_cities})
         
         # Try exact match first
-        for city_data in state_cities:
-            if normalized_target == city_data['normalized_name']:
-                return city_data
+        hit = exact_index_by_state.get(target_state, {}).get(normalized_target)
+        if hit is not None:
+            return hit
         
-        # Try fuzzy match
-        city_names = [city['normalized_name'] for city in state_cities]
-        match = process.extractOne(normalized_target, city_names, scorer=fuzz.ratio)
+        # Try fuzzy match - score_cutoff lets RapidFuzz skip hopeless candidates,
+        # and the returned index points straight at the matching city row
+        match = process.extractOne(normalized_target, state_cities['names'], 
+                                   scorer=fuzz.ratio, processor=default_process,
+                                   score_cutoff=threshold)
         
-        if match and match[1] >= threshold:
-            matched_city = next(city for city in state_cities 
-                              if city['normalized_name'] == match[0])
-            return matched_city
+        if match:
+            return int(state_cities['rows'][match[2]])
+        
+        return -1
+    
+    def fuzzy_match_cities(self, target_cities: List[str], target_states: List[str],
+                           cities_by_state: Dict, threshold: int = 80,
+                           exact_index_by_state: Dict = None) -> Tuple[np.ndarray, np.ndarray]:
+        """Find best matching cities for many targets, scoring each state with one cdist call.
+        
+        Returns matched city rows (-1 where nothing matched) and an exact-match mask,
+        both aligned with the input order.
+        """
+        targets = pd.DataFrame({
+            'city': [self.normalize_city_name(city) for city in target_cities],
+            'state': list(target_states)
+        })
+        if exact_index_by_state is None:
+            exact_index_by_state = self.build_exact_city_index(cities_by_state)
+        
+        # Resolve exact matches with one join on (state, normalized name)
+        exact_cities = pd.DataFrame(
+            [(state, name, row) for state, state_index in exact_index_by_state.items()
+             for name, row in state_index.items()],
+            columns=['state', 'city', 'row']
+        )
+        joined = targets.merge(exact_cities, on=['state', 'city'], how='left', validate='many_to_one')
+        is_exact = joined['row'].notna().to_numpy()
+        rows = joined['row'].fillna(-1).to_numpy(dtype=np.int64)
+        
+        # Only the remaining names go to RapidFuzz, one cdist call per state
+        unmatched = targets[~is_exact & (targets['city'] != '')]
+        for state, group in unmatched.groupby('state', sort=False):
+            state_cities = cities_by_state.get(state)
+            if not state_cities:
+                continue
+            
+            queries = group['city'].unique().tolist()
+            scores = process.cdist(queries, state_cities['names'], scorer=fuzz.ratio,
+                                   processor=default_process, 
+                                   score_cutoff=threshold, workers=-1)
+            best = scores.argmax(axis=1)
+            best_scores = scores[np.arange(len(queries)), best]
+            best_rows = pd.Series(np.where(best_scores >= threshold, state_cities['rows'][best], -1),
+                                  index=queries)
+            rows[group.index.to_numpy()] = best_rows.loc[group['city']].to_numpy()
         
-        return {}
\ No newline at end of file
+        return rows, is_exact